@@ -1,6 +1,4 @@
 from strategy import Strategy
-from collections import defaultdict
-import datetime
 
 class KillFollowStrategy(Strategy):
     def __init__(self, client, max_hold_time_sec=30):
@@ -8,36 +6,55 @@ class KillFollowStrategy(Strategy):
         self.max_hold_time_sec = max_hold_time_sec
 
     def detect_leader(self):
+        # For every buy, find the first sell of the same (trader, mint) strictly after it;
+        # a buy counts as a quick flip when that sell lands within max_hold_time_sec.
         query = f"""
         SELECT
-            ts, mint, traderPublicKey, txType, marketCapSol
-        FROM solana.pumpfun_from_events_mv
-        WHERE ts >= now() - INTERVAL 1 DAY
-        AND txType IN ('buy', 'sell')
-        ORDER BY traderPublicKey, mint, ts
+            traderPublicKey, groupArray(mint) AS mints
+        FROM (
+            SELECT
+                traderPublicKey, mint
+            FROM (
+                SELECT
+                    traderPublicKey, mint, txType,
+                    toUnixTimestamp64Milli(toDateTime64(ts, 3)) AS ts_ms,
+                    -- The frame starts 1 ms after the buy, so a sell sharing its timestamp
+                    -- never masks a later one; 0 means no sell follows.
+                    minIf(ts_ms, txType = 'sell') OVER (
+                        PARTITION BY traderPublicKey, mint
+                        ORDER BY ts_ms
+                        RANGE BETWEEN 1 FOLLOWING AND UNBOUNDED FOLLOWING
+                    ) AS next_sell_ms
+                FROM solana.pumpfun_from_events_mv
+                WHERE ts >= now() - INTERVAL 1 DAY
+                AND txType IN ('buy', 'sell')
+                AND (traderPublicKey, mint) IN (
+                    -- Only (trader, mint) pairs with both a buy and a sell can flip, and
+                    -- only traders with at least two such mints can pass the final filter.
+                    SELECT traderPublicKey, mint
+                    FROM (
+                        SELECT
+                            traderPublicKey, mint,
+                            count() OVER (PARTITION BY traderPublicKey) AS flip_mints
+                        FROM solana.pumpfun_from_events_mv
+                        WHERE ts >= now() - INTERVAL 1 DAY
+                        AND txType IN ('buy', 'sell')
+                        GROUP BY traderPublicKey, mint
+                        HAVING countIf(txType = 'buy') > 0 AND countIf(txType = 'sell') > 0
+                    )
+                    WHERE flip_mints >= 2
+                )
+            )
+            WHERE txType = 'buy'
+            AND next_sell_ms - ts_ms BETWEEN 1 AND {int(self.max_hold_time_sec * 1000)}
+            GROUP BY traderPublicKey, mint
+        )
+        GROUP BY traderPublicKey
+        HAVING length(mints) >= 2
         """
-        rows = self.client.execute(query)
+        columns = self.client.execute(query, columnar=True, settings={'max_block_size': 65536})
+        if not columns:
+            return {}
 
-        suspicious = defaultdict(list)
-        trades = defaultdict(lambda: defaultdict(list))
-        
-        for ts, mint, trader, tx_type, cap in rows:
-            ts = ts.replace(tzinfo=datetime.timezone.utc)
-            trades[trader][mint].append((ts, tx_type))
-
-        for trader, mint_dict in trades.items():
-            for mint, actions in mint_dict.items():
-                actions.sort() 
-                for i, (ts_i, type_i) in enumerate(actions):
-                    if type_i != 'buy':
-                        continue
-                    for j in range(i + 1, len(actions)):
-                        ts_j, type_j = actions[j]
-                        if type_j != 'sell':
-                            continue
-                        delta = (ts_j - ts_i).total_seconds()
-                        if 0 < delta <= self.max_hold_time_sec:
-                            suspicious[trader].append(mint)
-                            break  
-
-        return {addr: list(set(tokens)) for addr, tokens in suspicious.items() if len(set(tokens)) >= 2}
+        traders, mints = columns
+        return {trader: list(trader_mints) for trader, trader_mints in zip(traders, mints)}
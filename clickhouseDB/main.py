@@ -2,6 +2,7 @@ from sequenceStrategy import SequenceStrategy
 from killFollowStrategy import KillFollowStrategy
 from clickhouse_driver import Client
 import argparse
+import time
 import yaml
 
 STRATEGY_REGISTRY = {
@@ -12,6 +13,12 @@ STRATEGY_REGISTRY = {
 def load_config(path: str) -> dict:
     with open(path, "r") as f:
         return yaml.safe_load(f)
+
+def report_leaders(strategy):
+    leaders = strategy.detect_leader()
+    for leader, _ in leaders.items():
+        print(f"potential leader: {leader}")
+
 def main():
     parser = argparse.ArgumentParser(description="Leader Detection Strategy Runner")
     parser.add_argument(
@@ -36,9 +43,21 @@ def main():
     strategy_cls = STRATEGY_REGISTRY[strategy_name]
     strategy = strategy_cls(client, **strategy_params)
     
-    leaders = strategy.detect_leader()
-    for leader, _ in leaders.items():
-        print(f"potential leader: {leader}")
+    # With interval_sec set, keep running on the same client so each pass skips the
+    # TCP + ClickHouse handshake; otherwise run a single pass as before.
+    interval_sec = config.get("interval_sec")
+    if interval_sec is None:
+        report_leaders(strategy)
+        return
+    if interval_sec <= 0:
+        parser.error(f"interval_sec must be positive, got {interval_sec}")
+
+    while True:
+        try:
+            report_leaders(strategy)
+        except Exception as e:
+            print(f"Detection run failed: {e}")
+        time.sleep(interval_sec)
 
 
 if __name__ == "__main__":
@@ -1,76 +1,102 @@
 from clickhouse_driver import Client
-from collections import defaultdict, Counter
+from collections import defaultdict
 from itertools import combinations
 from strategy import Strategy
-import datetime
+import xxhash
 
 class SequenceStrategy(Strategy):
-    def __init__(self, client):
+    def __init__(self, client, time_window_sec=10):
         self.client = client
+        self.time_window_sec = time_window_sec
 
-    def fetch_buy_events(self):
-        query = """
+    def fetch_clusters(self):
+        # Per mint, every buy starts a window of the following buys within time_window_sec
+        # whose amount differs from the starting buy; windows of 3+ buys are clusters.
+        # The RANGE frame bounds each window at its time edge; same-ts peers that sort
+        # before the start in (ts_ms, trader, amount) order are filtered back out.
+        query = f"""
         SELECT
-            ts, mint, traderPublicKey, tokenAmount
-        FROM solana.pumpfun_from_events_mv
-        WHERE txType = 'buy' AND ts >= now() - INTERVAL 1 DAY
+            mint,
+            arrayConcat([start], arraySort(arrayFilter(
+                e -> e > start AND tupleElement(e, 3) != tupleElement(start, 3),
+                frame
+            ))) AS cluster
+        FROM (
+            SELECT
+                mint,
+                (ts_ms, traderPublicKey, amount) AS start,
+                groupArray((ts_ms, traderPublicKey, amount)) OVER (
+                    PARTITION BY mint
+                    ORDER BY ts_ms
+                    RANGE BETWEEN CURRENT ROW AND {int(self.time_window_sec * 1000)} FOLLOWING
+                ) AS frame
+            FROM (
+                SELECT
+                    toUnixTimestamp64Milli(toDateTime64(ts, 3)) AS ts_ms, mint, traderPublicKey,
+                    toFloat64(tokenAmount) AS amount
+                FROM solana.pumpfun_from_events_mv
+                WHERE txType = 'buy' AND ts >= now() - INTERVAL 1 DAY
 
-        UNION ALL
+                UNION ALL
 
-        SELECT
-            ts, inputTokenMint AS mint, traderPublicKey, qtyIn AS tokenAmount
-        FROM solana.raydium_from_events_mv
-        WHERE txType = 'buy' AND ts >= now() - INTERVAL 1 DAY
+                SELECT
+                    toUnixTimestamp64Milli(toDateTime64(ts, 3)) AS ts_ms, inputTokenMint AS mint, traderPublicKey,
+                    toFloat64(qtyIn) AS amount
+                FROM solana.raydium_from_events_mv
+                WHERE txType = 'buy' AND ts >= now() - INTERVAL 1 DAY
+            )
+        )
+        WHERE length(frame) >= 3 AND length(cluster) >= 3
         """
-        return self.client.execute(query)
-
-    def find_clusters(self, rows, time_window_sec=10):
-        mint_clusters = defaultdict(list)
-
-        for ts, mint, trader, amount in rows:
-            ts = ts.replace(tzinfo=datetime.timezone.utc)
-            mint_clusters[mint].append((ts, trader, amount))
+        columns = self.client.execute(query, columnar=True, settings={'max_block_size': 65536})
+        return columns if columns else [[], []]
 
+    def find_clusters(self, columns):
         combo_tracker = defaultdict(list)
+        combo_members = {}
+
+        for mint, cluster in zip(*columns):
+            cluster = [tuple(e) for e in cluster]
+            members = [e[1] for e in cluster]
+            # Key combos by a 64-bit fingerprint of the sorted members; the
+            # member tuple itself is kept once per combo in combo_members.
+            key = xxhash.xxh3_64_intdigest(b'\0'.join(sorted(t.encode() for t in members)))
+            if key not in combo_members:
+                combo_members[key] = tuple(sorted(members))
+            combo_tracker[key].append((mint, cluster))
 
-        for mint, events in mint_clusters.items():
-            events.sort()
-            for i in range(len(events)):
-                ts1, t1, a1 = events[i]
-                cluster = [(ts1, t1, a1)]
-                for j in range(i + 1, len(events)):
-                    ts2, t2, a2 = events[j]
-                    if (ts2 - ts1).total_seconds() <= time_window_sec:
-                        if a1 != a2:
-                            cluster.append((ts2, t2, a2))
-                    else:
-                        break
-                if len(cluster) >= 3:
-                    traders = tuple(sorted([x[1] for x in cluster]))
-                    combo_tracker[traders].append((mint, cluster))
+        return combo_tracker, combo_members
 
-        return combo_tracker
+    @staticmethod
+    def most_common(items):
+        if len(items) == 1:
+            return items[0]
+        counts = {}
+        for item in items:
+            counts[item] = counts.get(item, 0) + 1
+        # max() keeps the first key on ties, matching Counter.most_common's insertion order.
+        return max(counts, key=counts.get)
 
-    def detect_following_patterns(self, combo_tracker):
+    def detect_following_patterns(self, combo_tracker, combo_members):
         leader_candidates = defaultdict(list)
 
-        for combo, mint_clusters in combo_tracker.items():
+        for key, mint_clusters in combo_tracker.items():
             if len(mint_clusters) < 2:
                 continue
             seqs = [tuple(x[1][i][1] for i in range(len(x[1]))) for x in mint_clusters]
             if len(set(seqs)) > 1:
                 firsts = [seq[0] for seq in seqs]
-                common_first = Counter(firsts).most_common(1)[0][0]
+                common_first = self.most_common(firsts)
                 leader_candidates[common_first].append({
                     'mints': [x[0] for x in mint_clusters],
-                    'participants': combo,
+                    'participants': combo_members[key],
                     'sequences': seqs
                 })
 
         return leader_candidates
 
     def detect_leader(self):
-        rows = self.fetch_buy_events()
-        combos = self.find_clusters(rows)
-        leaders = self.detect_following_patterns(combos)
+        columns = self.fetch_clusters()
+        combos, members = self.find_clusters(columns)
+        leaders = self.detect_following_patterns(combos, members)
         return leaders
\ No newline at end of file
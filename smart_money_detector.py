@@ -1,11 +1,16 @@
+import asyncio
 import grpc
+import grpc.aio
 import logging
 import os
 import time
-from collections import defaultdict, deque, namedtuple
+from functools import lru_cache
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Set, Tuple, Optional, FrozenSet
 
+import numpy as np
+
 try:
     import geyser_pb2
     import geyser_pb2_grpc
@@ -24,17 +29,33 @@ GRPC_ENDPOINT = os.getenv("GRPC_ENDPOINT", "zewr2.tty0.co:10001")
 LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
 logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Buy event structure
-BuyEvent = namedtuple("BuyEvent", ["timestamp", "buyer", "token_mint", "amount", "market"])
+# Buy event structure: plain tuples indexed by these constants (cheaper than namedtuple attributes)
+BuyEvent = Tuple[datetime, str, str, int, str]
+TS, BUYER, MINT, AMT, MKT = 0, 1, 2, 3, 4
 
 # Parameters
 TIME_WINDOW_SECONDS = 30  # Time window to group events
 MIN_GROUP_SIZE = 3        # Minimum addresses in a group
 MIN_GROUP_SIGHTINGS = 2   # Minimum tokens bought by the same group
 HISTORY_MINUTES = 10      # How long to keep events
+RING_CAPACITY = 1_000_000  # Preallocated slots in the buy history buffers
+UPDATE_QUEUE_SIZE = 4096  # Pending gRPC updates before the oldest is dropped
+DROP_LOG_INTERVAL_SECONDS = 10  # How often dropped-update counts are reported
+BATCH_MAX_UPDATES = 64    # Updates parsed together per batch
+BATCH_MAX_WAIT_SECONDS = 0.01  # Longest a partial batch waits for more updates
 
 # Data stores
-recent_buys: deque[BuyEvent] = deque()
+# Recent buys are kept as parallel arrays ordered by time; live events are [ring_tail, ring_head).
+ring_ts_ns = np.zeros(RING_CAPACITY, dtype=np.int64)
+ring_buyer = np.zeros(RING_CAPACITY, dtype=np.int32)
+ring_mint = np.zeros(RING_CAPACITY, dtype=np.int32)
+ring_amount = np.zeros(RING_CAPACITY, dtype=np.uint64)
+ring_head = 0
+ring_tail = 0
+buyer_ids: Dict[str, int] = {}
+buyer_names: List[str] = []
+mint_ids: Dict[str, int] = {}
+mint_names: List[str] = []
 group_sightings: Dict[FrozenSet[str], List[str]] = defaultdict(list)
 group_first_buyer: Dict[FrozenSet[str], List[str]] = defaultdict(list)
 LEADER_LOG_COOLDOWN_SECONDS = 300
@@ -46,30 +67,43 @@ USDC_MINT = "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v"
 PUMP_FUN_PROGRAM_ID = "6EF8rrecthR5Dkzon8Nwu78hRvfCKubJ14M5uBEwF6P"
 RAYDIUM_AMM_V4_PROGRAM_ID = "675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8"
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 # Helper functions
-def parse_balance_changes(meta) -> Dict[str, Dict[str, Tuple[int, int]]]:
-    """Parse token balance changes: {owner: {mint: (pre_amount, post_amount)}}"""
-    changes = defaultdict(lambda: defaultdict(lambda: (0, 0)))
-
-    for b in getattr(meta, "pre_token_balances", []):
-        owner = str(b.owner)
-        mint = str(b.mint)
-        amount = int(getattr(getattr(b, "ui_token_amount", None), "amount", "0"))
-        changes[owner][mint] = (amount, 0)
-
-    for b in getattr(meta, "post_token_balances", []):
-        owner = str(b.owner)
-        mint = str(b.mint)
-        post_amount = int(getattr(getattr(b, "ui_token_amount", None), "amount", "0"))
-        pre_amount = changes[owner][mint][0]
-        changes[owner][mint] = (pre_amount, post_amount)
+def to_ns(ts: datetime) -> int:
+    return (ts - EPOCH) // timedelta(microseconds=1) * 1000
+
+def intern(ids: Dict[str, int], names: List[str], value: str) -> int:
+    idx = ids.get(value)
+    if idx is None:
+        idx = ids[value] = len(names)
+        names.append(value)
+    return idx
+
+@lru_cache(maxsize=65536)
+def _pk_str(key: bytes) -> str:
+    """Base58-encode a raw pubkey, memoized since program/quote mints recur in nearly every tx."""
+    return str(Pubkey(key))
+
+def parse_balance_changes(meta) -> Dict[Tuple[str, str], List[int]]:
+    """Parse token balance changes: {(owner, mint): [pre_amount, post_amount]}"""
+    changes: Dict[Tuple[str, str], List[int]] = {}
+
+    for idx, balances in enumerate((getattr(meta, "pre_token_balances", []),
+                                    getattr(meta, "post_token_balances", []))):
+        for b in balances:
+            key = (b.owner, b.mint)
+            slot = changes.get(key)
+            if slot is None:
+                slot = changes[key] = [0, 0]
+            slot[idx] = int(getattr(getattr(b, "ui_token_amount", None), "amount", "0"))
 
     return changes
 
 def find_market(account_keys: List[bytes], instructions) -> str:
     """Identify the DEX market from the transaction instructions."""
     try:
-        pubkeys = [str(Pubkey(key)) for key in account_keys]
+        pubkeys = [_pk_str(bytes(key)) for key in account_keys]
         for inst in instructions:
             if hasattr(inst, "program_id_index"):
                 idx = inst.program_id_index
@@ -84,38 +118,79 @@ def find_market(account_keys: List[bytes], instructions) -> str:
     return "Unknown"
 
 
-def detect_buyers(balance_changes) -> List[Tuple[str, str, int]]:
-    """Detect buyers from balance changes."""
+def detect_buyers(tx_idx, owners, mints, pre, post) -> List[Tuple[int, str, str, int]]:
+    """Detect (tx_idx, buyer, mint, amount) buys from a batch of flattened balance changes."""
+    # Resolve which (tx, owner) pairs paid with a quote mint once, up front; without any
+    # there can be no buys. Mint strings are only compared on rows whose balance moved.
+    dropped = np.flatnonzero(post < pre)
+    dropped_mints = mints[dropped]
+    quote_drop = dropped[(dropped_mints == WSOL_MINT) | (dropped_mints == USDC_MINT)]
+    if not len(quote_drop):
+        return []
+    paid_quote = set(zip(tx_idx[quote_drop].tolist(), owners[quote_drop].tolist()))
+
+    grew = np.flatnonzero(post > pre)
+    bought = grew[mints[grew] != WSOL_MINT]
+
     results = []
-    for owner, tokens in balance_changes.items():
-        for mint, (pre, post) in tokens.items():
-            if post > pre and mint != WSOL_MINT:
-                for quote_mint in [WSOL_MINT, USDC_MINT]:
-                    if quote_mint in tokens and tokens[quote_mint][1] < tokens[quote_mint][0]:
-                        amount_bought = post - pre
-                        results.append((owner, mint, amount_bought))
-                        break
+    for k in bought.tolist():
+        tx, owner = int(tx_idx[k]), owners[k]
+        if (tx, owner) in paid_quote:
+            results.append((tx, owner, mints[k], int(post[k] - pre[k])))
     return results
 
+def compact_ring():
+    """Move live events to the front of the buffers and re-intern the ids they use."""
+    global ring_head, ring_tail
+    if ring_head - ring_tail == RING_CAPACITY:
+        dropped = RING_CAPACITY // 4
+        logging.warning(f"Buy history full, dropping {dropped} oldest events")
+        ring_tail += dropped
+
+    live = ring_head - ring_tail
+    for arr in (ring_ts_ns, ring_buyer, ring_mint, ring_amount):
+        arr[:live] = arr[ring_tail:ring_head]
+    ring_head, ring_tail = live, 0
+
+    for ids, names, arr in ((buyer_ids, buyer_names, ring_buyer), (mint_ids, mint_names, ring_mint)):
+        used, remapped = np.unique(arr[:live], return_inverse=True)
+        kept = [names[i] for i in used]
+        arr[:live] = remapped
+        names[:] = kept
+        ids.clear()
+        ids.update((name, i) for i, name in enumerate(kept))
+
+def append_buy(event: BuyEvent) -> Tuple[int, int]:
+    """Append a buy to the history buffers and return its (buyer_idx, mint_idx)."""
+    global ring_head
+    if ring_head == RING_CAPACITY:
+        compact_ring()
+
+    buyer_idx = intern(buyer_ids, buyer_names, event[BUYER])
+    mint_idx = intern(mint_ids, mint_names, event[MINT])
+    ring_ts_ns[ring_head] = to_ns(event[TS])
+    ring_buyer[ring_head] = buyer_idx
+    ring_mint[ring_head] = mint_idx
+    ring_amount[ring_head] = event[AMT]
+    ring_head += 1
+    return buyer_idx, mint_idx
+
 def prune_old_events(now):
-    cutoff = now - timedelta(minutes=HISTORY_MINUTES)
-    while recent_buys and recent_buys[0].timestamp < cutoff:
-        recent_buys.popleft()
+    global ring_tail
+    cutoff_ns = to_ns(now - timedelta(minutes=HISTORY_MINUTES))
+    ring_tail += int(np.searchsorted(ring_ts_ns[ring_tail:ring_head], cutoff_ns, side='left'))
 
-def find_groups(now: datetime, new_event: BuyEvent):
-    window_start = now - timedelta(seconds=TIME_WINDOW_SECONDS)
-    matched = []
+def find_groups(now: datetime, new_event: BuyEvent, buyer_idx: int, mint_idx: int):
+    window_start_ns = to_ns(now - timedelta(seconds=TIME_WINDOW_SECONDS))
+    start = ring_tail + int(np.searchsorted(ring_ts_ns[ring_tail:ring_head], window_start_ns, side='left'))
 
-    for event in reversed(recent_buys):
-        if event.timestamp < window_start:
-            break
-        if event.token_mint == new_event.token_mint and event.buyer != new_event.buyer:
-            matched.append(event.buyer)
+    mask = (ring_mint[start:ring_head] == mint_idx) & (ring_buyer[start:ring_head] != buyer_idx)
+    matched = [buyer_names[i] for i in ring_buyer[start:ring_head][mask]]
 
     if len(matched) >= MIN_GROUP_SIZE - 1:
-        group = frozenset(matched + [new_event.buyer])
-        group_sightings[group].append(new_event.token_mint)
-        group_first_buyer[group].append(new_event.buyer)
+        group = frozenset(matched + [new_event[BUYER]])
+        group_sightings[group].append(new_event[MINT])
+        group_first_buyer[group].append(new_event[BUYER])
         analyze_group(group)
 
 def analyze_group(group: FrozenSet[str]):
@@ -140,8 +215,103 @@ def analyze_group(group: FrozenSet[str]):
                 print("-" * 40)
                 last_logged_leader[leader] = now
 
+def parse_transaction(update) -> Optional[Tuple[str, Dict[Tuple[str, str], List[int]]]]:
+    """Parse a transaction update into (market, balance_changes), or None if it carries no message."""
+    inner_tx = update.transaction.transaction
+    meta = getattr(inner_tx, "meta", None)
+    if not meta or not hasattr(inner_tx, "transaction"):
+        return None
+    tx_body = inner_tx.transaction
+    if not hasattr(tx_body, "message"):
+        return None
+
+    message = tx_body.message
+    account_keys = list(message.account_keys)
+    instructions = list(message.instructions)
+    market = find_market(account_keys, instructions)
+    return market, parse_balance_changes(meta)
+
+def parse_batch(items) -> List[BuyEvent]:
+    """Parse a batch of (received_at, update) items into buy events. Runs off the event loop."""
+    received, markets = [], []
+    tx_idx, owners, mints, pre, post = [], [], [], [], []
+    for received_at, update in items:
+        parsed = parse_transaction(update)
+        if parsed is None:
+            continue
+        market, balance_changes = parsed
+        i = len(markets)
+        received.append(received_at)
+        markets.append(market)
+        for (owner, mint), (pre_amount, post_amount) in balance_changes.items():
+            tx_idx.append(i)
+            owners.append(owner)
+            mints.append(mint)
+            pre.append(pre_amount)
+            post.append(post_amount)
+
+    if not tx_idx:
+        return []
+
+    buys = detect_buyers(
+        np.array(tx_idx, dtype=np.int32),
+        np.array(owners, dtype=object),
+        np.array(mints, dtype=object),
+        np.array(pre, dtype=np.uint64),
+        np.array(post, dtype=np.uint64),
+    )
+    return [(received[tx], buyer, mint, amount, markets[tx]) for tx, buyer, mint, amount in buys]
+
+def record_buys(events: List[BuyEvent]):
+    for event in events:
+        now_utc = event[TS]
+        buyer_idx, mint_idx = append_buy(event)
+        prune_old_events(now_utc)
+        find_groups(now_utc, event, buyer_idx, mint_idx)
+
+def enqueue_drop_oldest(queue: asyncio.Queue, item) -> bool:
+    """Enqueue without ever blocking the reader; returns True if the oldest item was dropped."""
+    dropped = queue.full()
+    if dropped:
+        queue.get_nowait()
+        queue.task_done()
+    queue.put_nowait(item)
+    return dropped
+
+async def drain_batch(queue: asyncio.Queue) -> list:
+    """Wait for one update, then keep collecting until the batch is full or the wait budget runs out."""
+    loop = asyncio.get_running_loop()
+    batch = [await queue.get()]
+    deadline = loop.time() + BATCH_MAX_WAIT_SECONDS
+    while len(batch) < BATCH_MAX_UPDATES:
+        if not queue.empty():
+            batch.append(queue.get_nowait())
+            continue
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+async def analysis_worker(queue: asyncio.Queue):
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = await drain_batch(queue)
+        try:
+            events = await loop.run_in_executor(None, parse_batch, batch)
+            # Shared detector state is only touched from the event loop thread.
+            record_buys(events)
+        except Exception as e:
+            logging.error(f"Error analyzing transactions: {e}")
+        finally:
+            for _ in batch:
+                queue.task_done()
+
 # Main gRPC listening loop
-def run():
+async def run():
     channel_options = [
         ("grpc.keepalive_time_ms", 30000),
         ("grpc.keepalive_timeout_ms", 10000),
@@ -151,7 +321,7 @@ def run():
         ("grpc.max_receive_message_length", -1)
     ]
 
-    with grpc.insecure_channel(GRPC_ENDPOINT, options=channel_options) as channel:
+    async with grpc.aio.insecure_channel(GRPC_ENDPOINT, options=channel_options) as channel:
         stub = geyser_pb2_grpc.GeyserStub(channel)
         subscribe_request = geyser_pb2.SubscribeRequest(
             transactions={
@@ -164,41 +334,37 @@ def run():
             commitment=geyser_pb2.CommitmentLevel.FINALIZED
         )
 
-        while True:
-            try:
-                stream = stub.Subscribe(iter([subscribe_request]))
-                for update in stream:
-                    if update.HasField("transaction"):
-                        wrapper = update.transaction
-                        inner_tx = wrapper.transaction
-                        meta = getattr(inner_tx, "meta", None)
-                        now_utc = datetime.now(timezone.utc)
-
-                        if meta and hasattr(inner_tx, "transaction"):
-                            tx_body = inner_tx.transaction
-                            if hasattr(tx_body, "message"):
-                                message = tx_body.message
-                                account_keys = list(message.account_keys)
-                                instructions = list(message.instructions)
-                                market = find_market(account_keys, instructions)
-                                balance_changes = parse_balance_changes(meta)
-                                buys = detect_buyers(balance_changes)
-
-                                for buyer, mint, amount in buys:
-                                    event = BuyEvent(now_utc, buyer, mint, amount, market)
-                                    recent_buys.append(event)
-                                    prune_old_events(now_utc)
-                                    find_groups(now_utc, event)
-
-            except grpc.RpcError as e:
-                print(f"gRPC Error: {e.code()} - {e.details()}. Reconnecting...")
-                time.sleep(5)
-            except KeyboardInterrupt:
-                print("Interrupted. Exiting...")
-                break
-            except Exception as e:
-                print(f"Unexpected error: {e}. Reconnecting...")
-                time.sleep(5)
+        queue = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+        # A single consumer records batches in receive order; group detection and the
+        # leader vote depend on which buy completes a group.
+        worker = asyncio.create_task(analysis_worker(queue))
+        dropped_updates = 0
+        last_drop_log = time.monotonic()
+        try:
+            while True:
+                try:
+                    stream = stub.Subscribe(iter([subscribe_request]))
+                    async for update in stream:
+                        # Keep the receive path minimal so the server never sees a lagging consumer.
+                        if update.HasField("transaction"):
+                            if enqueue_drop_oldest(queue, (datetime.now(timezone.utc), update)):
+                                dropped_updates += 1
+                        if dropped_updates and time.monotonic() - last_drop_log >= DROP_LOG_INTERVAL_SECONDS:
+                            logging.warning(f"Analysis falling behind, dropped {dropped_updates} oldest updates")
+                            dropped_updates = 0
+                            last_drop_log = time.monotonic()
+
+                except grpc.RpcError as e:
+                    print(f"gRPC Error: {e.code()} - {e.details()}. Reconnecting...")
+                    await asyncio.sleep(5)
+                except Exception as e:
+                    print(f"Unexpected error: {e}. Reconnecting...")
+                    await asyncio.sleep(5)
+        finally:
+            worker.cancel()
 
 if __name__ == "__main__":
-    run()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("Interrupted. Exiting...")